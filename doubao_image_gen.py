@@ -9,17 +9,30 @@ Implements image generation functionality based on Volcano Engine API
 """
 
 import os
+import re
 import sys
+import math
 import time
+import json
+import uuid
+import random
+import shutil
+import queue
 import asyncio
+import hashlib
 import logging
+import threading
+from logging.handlers import RotatingFileHandler
+from functools import lru_cache
 from pathlib import Path
-from typing import Dict, Any, Optional
+from types import MappingProxyType, SimpleNamespace
+from typing import Dict, Any, List, Optional, Tuple, Annotated
 from datetime import datetime
 
 import requests
 from PIL import Image
 from io import BytesIO
+from pydantic import AfterValidator, Field, ValidationError
 from volcenginesdkarkruntime import Ark
 
 # Function for outputting debug information to stderr
@@ -29,6 +42,11 @@ def debug_print(*args, **kwargs):
     将调试信息输出到stderr"""
     print(*args, file=sys.stderr, **kwargs)
 
+# Log rotation limits shared by both modules, keep log/ from growing forever
+# 两个模块共用的日志轮转限制，避免log目录无限增长
+LOG_MAX_BYTES = 10 * 1024 * 1024
+LOG_BACKUP_COUNT = 5
+
 # Setup logging system
 # 设置日志系统
 def setup_logging():
@@ -53,7 +71,12 @@ def setup_logging():
     if not logger.handlers:
         # File handler
         # 文件handler
-        file_handler = logging.FileHandler(log_dir / 'doubao_image_gen.log', encoding='utf-8')
+        file_handler = RotatingFileHandler(
+            log_dir / 'doubao_image_gen.log',
+            maxBytes=LOG_MAX_BYTES,
+            backupCount=LOG_BACKUP_COUNT,
+            encoding='utf-8'
+        )
         file_handler.setLevel(logging.DEBUG)
         file_handler.setFormatter(logging.Formatter(log_format))
         logger.addHandler(file_handler)
@@ -67,11 +90,411 @@ def setup_logging():
     
     return logger
 
+# Define available image resolutions (frozen lookup shared by all tools)
+# 定义可用的图片分辨率（所有工具共用的只读查找表）
+AVAILABLE_RESOLUTIONS = MappingProxyType({
+    "512x512": "512x512 (1:1 Small Square)",
+    "768x768": "768x768 (1:1 Square)",
+    "1024x1024": "1024x1024 (1:1 Large Square)",
+    "864x1152": "864x1152 (3:4 Portrait)",
+    "1152x864": "1152x864 (4:3 Landscape)",
+    "1280x720": "1280x720 (16:9 Widescreen)",
+    "720x1280": "720x1280 (9:16 Mobile Portrait)",
+    "832x1248": "832x1248 (2:3)",
+    "1248x832": "1248x832 (3:2)",
+    "1512x648": "1512x648 (21:9 Ultra-wide)",
+    "2048x2048": "2048x2048 (1:1 Extra Large Square)"
+})
+
+# Model limits for custom WxH resolutions
+# 自定义WxH分辨率的模型限制
+MIN_IMAGE_SIDE = 512
+MAX_IMAGE_SIDE = 2048
+CUSTOM_RESOLUTION_NOTE = f"Custom WxH sizes are also accepted, width and height between {MIN_IMAGE_SIDE} and {MAX_IMAGE_SIDE}"
+
+_RESOLUTION_PATTERN = re.compile(r"([0-9]{1,5})x([0-9]{1,5})")
+
+@lru_cache(maxsize=256)
+def normalize_resolution(size: str) -> str:
+    """Validate a preset or custom WxH resolution and return it in canonical form
+    验证预设或自定义的WxH分辨率，并返回规范形式"""
+    match = _RESOLUTION_PATTERN.fullmatch(size)
+    if not match:
+        available = ", ".join(AVAILABLE_RESOLUTIONS)
+        raise ValueError(f"Invalid resolution '{size}'. Use WxH or one of: {available}")
+    width, height = int(match.group(1)), int(match.group(2))
+    normalized = f"{width}x{height}"
+    if normalized in AVAILABLE_RESOLUTIONS:
+        return normalized
+    if not (MIN_IMAGE_SIDE <= width <= MAX_IMAGE_SIDE and MIN_IMAGE_SIDE <= height <= MAX_IMAGE_SIDE):
+        raise ValueError(f"Resolution '{size}' out of range, width and height must be between {MIN_IMAGE_SIDE} and {MAX_IMAGE_SIDE}")
+    return normalized
+
+# Generation parameter types, the single source of validation rules for the MCP tool arguments
+# 生成参数类型，MCP工具参数共用的唯一验证规则来源
+PromptField = Annotated[str, Field(
+    pattern=r"\S",
+    description="Prompt for image generation, supports Chinese and English descriptions, cannot be blank"
+)]
+SizeField = Annotated[str, Field(
+    description="Image width and height in pixels, available values:\n"
+    + "\n".join(f"• {key}: {value}" for key, value in AVAILABLE_RESOLUTIONS.items())
+    + f"\n{CUSTOM_RESOLUTION_NOTE}"
+), AfterValidator(normalize_resolution)]
+SeedField = Annotated[int, Field(
+    ge=-1, le=2147483647,
+    description="Random seed for controlling model generation randomness, if not specified, a random number will be auto-generated"
+)]
+GuidanceScaleField = Annotated[float, Field(
+    ge=1.0, le=10.0,
+    description="Consistency between model output and prompt, higher values follow prompt more strictly"
+)]
+WatermarkField = Annotated[bool, Field(description="Whether to add watermark to generated images")]
+FilePrefixField = Annotated[Optional[str], Field(
+    max_length=20, pattern=r"^[A-Za-z0-9_-]*$",
+    description="Image filename prefix (letters, numbers, underscores and hyphens only), max 20 characters"
+)]
+
+def format_validation_error(error: ValidationError) -> str:
+    """Format a pydantic validation error as a single line
+    将pydantic验证错误格式化为单行文本"""
+    return "; ".join(
+        f"{'.'.join(str(loc) for loc in item['loc'])}: {item['msg']}"
+        for item in error.errors(include_url=False)
+    )
+
+class InsufficientDiskSpaceError(Exception):
+    """Raised when free disk space is below the configured threshold
+    当可用磁盘空间低于配置阈值时抛出"""
+
+class ApiRequestError(Exception):
+    """Raised when the Doubao API call fails or returns an empty response
+    当豆包API调用失败或返回空响应时抛出"""
+
+class ImageDownloadError(ValueError):
+    """Raised when the generated image cannot be downloaded after all retries
+    当重试后仍无法下载生成的图片时抛出"""
+
+class CassetteMissError(ValueError):
+    """Raised in replay mode when no recording exists for a request
+    回放模式下请求没有对应录制数据时抛出"""
+
+# Age in seconds after which a leftover .part image file is considered stale
+# 遗留的.part临时图片文件被视为过期的秒数
+STALE_PART_FILE_AGE = 3600
+
+# Available cassette modes
+# 可用的录制/回放模式
+CASSETTE_MODES = ("off", "record", "replay")
+
+class CassetteStore:
+    """Local cassette store for recording and replaying API responses
+    用于录制和回放API响应的本地磁带存储"""
+    
+    def __init__(self, cassette_dir: str):
+        """Initialize cassette store
+        
+        初始化磁带存储
+        
+        Args:
+            cassette_dir: Cassette storage directory / 磁带存储目录
+        """
+        self.cassette_path = Path(cassette_dir)
+        self.cassette_path.mkdir(parents=True, exist_ok=True)
+    
+    @staticmethod
+    def make_key(**params) -> str:
+        """Build a deterministic key from request parameters
+        根据请求参数生成确定性的键"""
+        payload = json.dumps(params, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+    
+    def _entry_path(self, key: str) -> Path:
+        return self.cassette_path / f"{key}.json"
+    
+    def _body_path(self, key: str) -> Path:
+        return self.cassette_path / f"{key}.jpg"
+    
+    @staticmethod
+    def _write_atomic(path: Path, data: bytes) -> None:
+        """Write to a temporary file and rename it, so readers never see a partial file
+        先写入临时文件再重命名，读取方不会看到不完整的文件"""
+        temp_path = path.with_name(path.name + ".part")
+        try:
+            temp_path.write_bytes(data)
+            os.replace(temp_path, path)
+        except BaseException:
+            temp_path.unlink(missing_ok=True)
+            raise
+    
+    def save(
+        self,
+        key: str,
+        params: Dict[str, Any],
+        response: Any,
+        api_latency: float,
+        image_data: bytes,
+        download_latency: float
+    ) -> None:
+        """Persist a complete recording (response and image body) in one step
+        一次性保存完整的录制数据（响应和图片数据）"""
+        entry = {
+            "params": params,
+            "response": {
+                "model": getattr(response, 'model', None),
+                "created": getattr(response, 'created', None),
+                "urls": [item.url for item in response.data] if response and response.data else []
+            },
+            "api_latency": api_latency,
+            "download_latency": download_latency
+        }
+        # Body first, so an entry is never visible without its body
+        # 先写图片数据，保证条目可见时图片数据已存在
+        self._write_atomic(self._body_path(key), image_data)
+        self._write_atomic(self._entry_path(key), json.dumps(entry, ensure_ascii=False, indent=2).encode("utf-8"))
+    
+    def load_response(self, key: str) -> tuple:
+        """Load a recorded response, returns (response, latency, recorded seed)
+        加载录制的响应，返回(响应, 耗时, 录制时使用的种子)"""
+        entry_path = self._entry_path(key)
+        if not entry_path.exists():
+            raise CassetteMissError(f"No recorded cassette for this request (key: {key})")
+        entry = json.loads(entry_path.read_text(encoding="utf-8"))
+        recorded = entry["response"]
+        response = SimpleNamespace(
+            model=recorded.get("model"),
+            created=recorded.get("created"),
+            data=[SimpleNamespace(url=url) for url in recorded.get("urls", [])]
+        )
+        return response, entry.get("api_latency", 0.0), entry["params"]["seed"]
+    
+    def load_image(self, key: str) -> tuple:
+        """Load a recorded image body, returns (image_data, latency)
+        加载录制的图片数据，返回(图片数据, 耗时)"""
+        body_path = self._body_path(key)
+        if not body_path.exists():
+            raise CassetteMissError(f"No recorded image body for this request (key: {key})")
+        entry = json.loads(self._entry_path(key).read_text(encoding="utf-8"))
+        return body_path.read_bytes(), entry.get("download_latency", 0.0)
+
+class _RetentionTarget:
+    """Incrementally indexed directory with its retention policy
+    增量索引的目录及其保留策略"""
+    
+    def __init__(self, directory: Path, pattern: str, max_age: float, max_total_bytes: int, max_files: int):
+        self.directory = directory
+        self.pattern = pattern
+        self.max_age = max_age
+        self.max_total_bytes = max_total_bytes
+        self.max_files = max_files
+        self.index: Dict[str, Tuple[float, int]] = {}
+        self.dir_mtime_ns: Optional[int] = None
+    
+    def refresh(self, force: bool = False) -> None:
+        """Re-list the directory only if it changed (or forced), stat only new entries
+        仅在目录变化（或强制）时重新列出，仅对新文件执行stat"""
+        try:
+            dir_mtime_ns = os.stat(self.directory).st_mtime_ns
+        except FileNotFoundError:
+            self.index.clear()
+            self.dir_mtime_ns = None
+            return
+        if dir_mtime_ns == self.dir_mtime_ns and not force:
+            return
+        
+        seen = set()
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                if not entry.is_file() or not Path(entry.name).match(self.pattern):
+                    continue
+                seen.add(entry.name)
+                if entry.name not in self.index:
+                    try:
+                        stat = entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    self.index[entry.name] = (stat.st_mtime, stat.st_size)
+        for name in set(self.index) - seen:
+            del self.index[name]
+        self.dir_mtime_ns = dir_mtime_ns
+    
+    def note_own_change(self, before_ns: int, after_ns: int) -> None:
+        """Accept a directory change made by this process if the index was current before it
+        如果变更前索引是最新的，则接受本进程对目录的变更，避免下次重新扫描"""
+        if self.dir_mtime_ns == before_ns:
+            self.dir_mtime_ns = after_ns
+    
+    def select_expired(self, now: float) -> List[str]:
+        """Return file names to delete, oldest first
+        返回需要删除的文件名，按从旧到新排序"""
+        ordered = sorted(self.index.items(), key=lambda item: item[1][0])
+        total_bytes = sum(size for _, (_, size) in ordered)
+        remaining = len(ordered)
+        expired = []
+        for name, (mtime, size) in ordered:
+            too_old = self.max_age > 0 and now - mtime > self.max_age
+            too_many = self.max_files > 0 and remaining > self.max_files
+            too_big = self.max_total_bytes > 0 and total_bytes > self.max_total_bytes
+            if not (too_old or too_many or too_big):
+                break
+            expired.append(name)
+            total_bytes -= size
+            remaining -= 1
+        return expired
+
+class OutputJanitor:
+    """Background janitor applying retention policies to output directories
+    后台清理器，对输出目录应用保留策略"""
+    
+    # Force a full directory listing every N passes to catch external changes
+    # 每N次清理强制完整列出目录，以发现外部变更
+    FULL_RESCAN_PASSES = 12
+    
+    def __init__(self, interval: float, logger: logging.Logger):
+        """Initialize janitor
+        
+        初始化清理器
+        
+        Args:
+            interval: Seconds between cleanup passes / 两次清理之间的秒数
+            logger: Logger instance / 日志记录器
+        """
+        if interval <= 0:
+            raise ValueError("Janitor interval must be positive")
+        self.interval = interval
+        self.logger = logger
+        self._targets: List[_RetentionTarget] = []
+        # Files written by generations, drained by the janitor thread which alone owns the indexes
+        # 生成时写入的文件，由独占索引的清理线程取出处理
+        self._tracked: queue.SimpleQueue = queue.SimpleQueue()
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._passes = 0
+    
+    def add_target(self, directory: Path, pattern: str, max_age: float = 0, max_total_bytes: int = 0, max_files: int = 0) -> None:
+        """Register a directory to clean, a limit of 0 disables it
+        注册需要清理的目录，限制为0表示不启用"""
+        if max_age <= 0 and max_total_bytes <= 0 and max_files <= 0:
+            return
+        self._targets.append(_RetentionTarget(Path(directory), pattern, max_age, max_total_bytes, max_files))
+    
+    def track(self, path: Path, dir_mtime_before_ns: Optional[int] = None) -> None:
+        """Record a newly written file without waiting for the next scan, never blocks on a cleanup pass
+        
+        记录新写入的文件，无需等待下一次扫描，不会被清理过程阻塞
+        
+        Args:
+            path: Newly written file / 新写入的文件
+            dir_mtime_before_ns: Directory mtime before the write, lets the next pass skip rescanning /
+                                 写入前的目录修改时间，使下一次清理无需重新扫描
+        """
+        path = Path(path)
+        try:
+            stat = path.stat()
+            dir_mtime_after_ns = os.stat(path.parent).st_mtime_ns
+        except OSError:
+            return
+        self._tracked.put((path, stat.st_mtime, stat.st_size, dir_mtime_before_ns, dir_mtime_after_ns))
+    
+    def _drain_tracked(self) -> None:
+        while True:
+            try:
+                path, mtime, size, before_ns, after_ns = self._tracked.get_nowait()
+            except queue.Empty:
+                return
+            for target in self._targets:
+                if path.parent != target.directory:
+                    continue
+                if path.match(target.pattern):
+                    target.index[path.name] = (mtime, size)
+                if before_ns is not None:
+                    target.note_own_change(before_ns, after_ns)
+    
+    def run_once(self) -> int:
+        """Run a single cleanup pass on the janitor thread, returns number of deleted files
+        在清理线程中执行一次清理，返回删除的文件数"""
+        deleted = 0
+        now = time.time()
+        force = self._passes % self.FULL_RESCAN_PASSES == 0
+        self._passes += 1
+        self._drain_tracked()
+        for target in self._targets:
+            target.refresh(force)
+        dir_mtimes = {target.directory: target.dir_mtime_ns for target in self._targets}
+        
+        for target in self._targets:
+            for name in target.select_expired(now):
+                try:
+                    (target.directory / name).unlink()
+                    deleted += 1
+                except FileNotFoundError:
+                    pass
+                except OSError as e:
+                    self.logger.warning(f"Janitor failed to delete {target.directory / name}: {str(e)}")
+                    continue
+                target.index.pop(name, None)
+        
+        # Our own deletions should not force a rescan on the next pass
+        # 本次删除不应导致下一次清理重新扫描
+        for directory, before_ns in dir_mtimes.items():
+            if before_ns is None:
+                continue
+            try:
+                after_ns = os.stat(directory).st_mtime_ns
+            except FileNotFoundError:
+                continue
+            for target in self._targets:
+                if target.directory == directory:
+                    target.note_own_change(before_ns, after_ns)
+        if deleted:
+            self.logger.info(f"Janitor deleted {deleted} expired file(s)")
+        return deleted
+    
+    def start(self) -> None:
+        """Start the background cleanup thread
+        启动后台清理线程"""
+        if not self._targets or (self._thread and self._thread.is_alive()):
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="doubao-janitor", daemon=True)
+        self._thread.start()
+        self.logger.info(f"Janitor started, interval: {self.interval}s, targets: {[str(t.directory) for t in self._targets]}")
+    
+    def stop(self) -> None:
+        """Stop the background cleanup thread
+        停止后台清理线程"""
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+    
+    def _run(self) -> None:
+        while not self._stop_event.is_set():
+            try:
+                self.run_once()
+            except Exception as e:
+                self.logger.error(f"Janitor pass failed: {str(e)}", exc_info=True)
+            self._stop_event.wait(self.interval)
+
 class DoubaoImageGenerator:
     """Doubao image generation tool class
     豆包图像生成工具类"""
     
-    def __init__(self, base_url: str, api_key: str, model_id: str, save_dir: str):
+    def __init__(
+        self,
+        base_url: str,
+        api_key: str,
+        model_id: str,
+        save_dir: str,
+        cassette_mode: str = "off",
+        cassette_dir: Optional[str] = None,
+        latency_scale: float = 1.0,
+        retention_max_age: float = 0,
+        retention_max_bytes: int = 0,
+        retention_max_files: int = 0,
+        min_free_bytes: int = 0,
+        janitor_interval: float = 300
+    ):
         """Initialize image generation tool
         
         初始化图像生成工具
@@ -81,6 +504,14 @@ class DoubaoImageGenerator:
             api_key: API key / API密钥
             model_id: Model ID / 模型ID
             save_dir: Image save directory / 图片保存目录
+            cassette_mode: "off", "record" or "replay" / 录制回放模式
+            cassette_dir: Cassette storage directory / 磁带存储目录
+            latency_scale: Factor applied to recorded latencies on replay / 回放时录制耗时的缩放系数
+            retention_max_age: Delete images older than this many seconds, 0 disables / 删除超过该秒数的图片，0表示不启用
+            retention_max_bytes: Keep total image size under this many bytes, 0 disables / 图片总大小上限（字节），0表示不启用
+            retention_max_files: Keep at most this many images, 0 disables / 最多保留的图片数量，0表示不启用
+            min_free_bytes: Refuse new generations below this free space, 0 disables / 可用空间低于该值时拒绝生成，0表示不启用
+            janitor_interval: Seconds between background cleanup passes / 后台清理间隔秒数
         """
         self.logger = setup_logging()
         
@@ -96,6 +527,22 @@ class DoubaoImageGenerator:
         self.logger.info(f"MODEL_ID: {model_id}")
         self.logger.info(f"SAVE_DIR: {save_dir}")
         
+        # Setup record/replay cassette store
+        # 设置录制/回放磁带存储
+        if cassette_mode not in CASSETTE_MODES:
+            raise ValueError(f"Invalid cassette mode '{cassette_mode}'. Available modes: {', '.join(CASSETTE_MODES)}")
+        if not (math.isfinite(latency_scale) and latency_scale >= 0):
+            raise ValueError("latency_scale must be a finite, non-negative number")
+        self.cassette_mode = cassette_mode
+        self.latency_scale = latency_scale
+        self.cassette = None
+        if cassette_mode != "off":
+            if not cassette_dir:
+                raise ValueError(f"cassette_dir is required in {cassette_mode} mode")
+            self.cassette = CassetteStore(cassette_dir)
+            self.logger.info(f"CASSETTE_MODE: {cassette_mode}, CASSETTE_DIR: {cassette_dir}, LATENCY_SCALE: {latency_scale}")
+            debug_print(f"✓ Cassette {cassette_mode} mode: {Path(cassette_dir).absolute()}")
+        
         # Initialize Ark client
         # 初始化Ark客户端
         try:
@@ -123,6 +570,34 @@ class DoubaoImageGenerator:
             self.logger.error(error_msg)
             debug_print(f"❌ {error_msg}")
             raise
+        
+        # Start background janitor for images and rotated logs
+        # 启动图片和轮转日志的后台清理器
+        self.min_free_bytes = min_free_bytes
+        self.janitor = OutputJanitor(janitor_interval, self.logger)
+        self.janitor.add_target(
+            self.save_path, "image_*.jpg",
+            max_age=retention_max_age,
+            max_total_bytes=retention_max_bytes,
+            max_files=retention_max_files
+        )
+        self.janitor.add_target(Path("log"), "*.log.*", max_age=retention_max_age)
+        # Temporary files left behind by a crash between write and rename
+        # 写入与重命名之间进程崩溃时遗留的临时文件
+        self.janitor.add_target(self.save_path, "image_*.jpg.part", max_age=STALE_PART_FILE_AGE)
+        self.janitor.start()
+    
+    def _check_free_space(self, required_bytes: int = 0) -> None:
+        """Refuse to write when free disk space falls below the threshold
+        可用磁盘空间低于阈值时拒绝写入"""
+        if self.min_free_bytes <= 0:
+            return
+        free_bytes = shutil.disk_usage(self.save_path).free
+        if free_bytes - required_bytes < self.min_free_bytes:
+            raise InsufficientDiskSpaceError(
+                f"Insufficient disk space in {self.save_path.absolute()}: "
+                f"{free_bytes // (1024 * 1024)} MB free, {self.min_free_bytes // (1024 * 1024)} MB required"
+            )
     
     async def generate_image(
         self,
@@ -140,7 +615,7 @@ class DoubaoImageGenerator:
         Args:
             prompt: Prompt for image generation / 用于生成图像的提示词
             size: Image width and height in pixels / 生成图像的宽高像素
-            seed: Random seed / 随机数种子
+            seed: Random seed, -1 picks a random one / 随机数种子，-1表示随机生成
             guidance_scale: Consistency between model output and prompt / 模型输出结果与prompt的一致程度
             watermark: Whether to add watermark to generated image / 是否在生成的图片中添加水印
             file_prefix: Image filename prefix / 图片文件名前缀
@@ -156,24 +631,55 @@ class DoubaoImageGenerator:
         
         debug_print(f"🎨 Generating image...")
         
+        total_start = time.monotonic()
+        
         try:
             # Parameter validation
             # 参数验证
             if not prompt.strip():
                 raise ValueError("Prompt cannot be empty")
             
+            # Check free space before spending API quota
+            # 在消耗API额度之前检查可用空间
+            self._check_free_space()
+            
+            # Cassette key derived from request parameters as sent by the caller,
+            # so requests with seed -1 can be replayed
+            # 根据调用方发送的请求参数生成磁带键，使seed为-1的请求也能回放
+            request_params = {
+                "model": self.model_id,
+                "prompt": prompt,
+                "size": size,
+                "seed": seed,
+                "guidance_scale": guidance_scale,
+                "watermark": watermark
+            }
+            cassette_key = CassetteStore.make_key(**request_params) if self.cassette else None
+            
             # Call Doubao API to generate image
             # 调用豆包API生成图片
-            self.logger.info("Calling Doubao API to generate image")
-            response = self.client.images.generate(
-                model=self.model_id,
-                prompt=prompt,
-                size=size,
-                seed=seed,
-                guidance_scale=guidance_scale,
-                watermark=watermark,
-                response_format="url"  # 固定使用URL格式
-            )
+            api_start = time.monotonic()
+            if self.cassette_mode == "replay":
+                self.logger.info(f"Replaying recorded API response: {cassette_key}")
+                response, latency, seed = self.cassette.load_response(cassette_key)
+                await asyncio.sleep(latency * self.latency_scale)
+            else:
+                # Process seed parameter: if -1, generate a random number
+                # 处理seed参数：如果是-1，则生成随机数
+                if seed == -1:
+                    seed = random.randint(0, 2147483647)
+                    self.logger.info(f"Generated random seed: {seed}")
+                request_params = {**request_params, "seed": seed}
+                
+                self.logger.info("Calling Doubao API to generate image")
+                try:
+                    response = self.client.images.generate(
+                        **request_params,
+                        response_format="url"  # 固定使用URL格式
+                    )
+                except Exception as e:
+                    raise ApiRequestError(f"Doubao API call failed: {str(e)}") from e
+            api_seconds = time.monotonic() - api_start
             
             self.logger.info("API call successful, processing response")
             debug_print("✓ API call successful")
@@ -181,7 +687,7 @@ class DoubaoImageGenerator:
             # Check response
             # 检查响应
             if not response or not response.data:
-                raise ValueError("API returned empty response")
+                raise ApiRequestError("API returned empty response")
             
             # Get image URL
             # 获取图片URL
@@ -193,24 +699,40 @@ class DoubaoImageGenerator:
             self.logger.info("Starting image download")
             debug_print("📥 Downloading image...")
             
-            # Add retry mechanism for image download
-            # 添加重试机制的图片下载
-            max_retries = 3
-            retry_delay = 2
-            
-            for attempt in range(max_retries):
-                try:
-                    # Asynchronously download image
-                    # 异步下载图片
-                    image_data = await self._download_image_async(image_url)
-                    break
-                except Exception as e:
-                    if attempt < max_retries - 1:
-                        self.logger.warning(f"Image download failed (attempt {attempt + 1}/{max_retries}): {str(e)}")
-                        await asyncio.sleep(retry_delay)
-                        retry_delay *= 2  # Exponential backoff / 指数退避
-                    else:
-                        raise
+            download_start = time.monotonic()
+            download_attempts = 1
+            if self.cassette_mode == "replay":
+                # Serve recorded image body with recorded (scaled) latency
+                # 以录制的（缩放后的）耗时返回录制的图片数据
+                image_data, latency = self.cassette.load_image(cassette_key)
+                await asyncio.sleep(latency * self.latency_scale)
+            else:
+                # Add retry mechanism for image download
+                # 添加重试机制的图片下载
+                max_retries = 3
+                retry_delay = 2
+                
+                for attempt in range(max_retries):
+                    download_attempts = attempt + 1
+                    try:
+                        # Asynchronously download image
+                        # 异步下载图片
+                        image_data = await self._download_image_async(image_url)
+                        break
+                    except Exception as e:
+                        if attempt < max_retries - 1:
+                            self.logger.warning(f"Image download failed (attempt {attempt + 1}/{max_retries}): {str(e)}")
+                            await asyncio.sleep(retry_delay)
+                            retry_delay *= 2  # Exponential backoff / 指数退避
+                        else:
+                            raise ImageDownloadError(f"{str(e)} (after {max_retries} attempts)") from e
+                
+                if self.cassette_mode == "record":
+                    self.cassette.save(
+                        cassette_key, request_params, response, api_seconds,
+                        image_data, time.monotonic() - download_start
+                    )
+            download_seconds = time.monotonic() - download_start
             
             self.logger.info("Image download successful")
             debug_print("✓ Image download successful")
@@ -218,27 +740,38 @@ class DoubaoImageGenerator:
             # Generate filename
             # 生成文件名
             if file_prefix:
-                filename = f"image_{file_prefix}_{int(time.time())}.jpg"
+                filename = f"image_{file_prefix}_{int(time.time())}_{uuid.uuid4().hex[:8]}.jpg"
             else:
                 timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-                filename = f"image_{timestamp}.jpg"
+                filename = f"image_{timestamp}_{uuid.uuid4().hex[:8]}.jpg"
             
             # Save image
             # 保存图片
             image_path = self.save_path / filename
             
-            # Save image data to file
-            # 将图片数据保存到文件
-            with open(image_path, 'wb') as f:
-                f.write(image_data)
+            # Save image data to a temporary file and rename it, so no truncated image is left behind
+            # 先写入临时文件再重命名，避免留下不完整的图片
+            save_start = time.monotonic()
+            self._check_free_space(len(image_data))
+            temp_path = image_path.with_name(image_path.name + ".part")
+            dir_mtime_before_ns = os.stat(self.save_path).st_mtime_ns
+            try:
+                with open(temp_path, 'wb') as f:
+                    f.write(image_data)
+                os.replace(temp_path, image_path)
+            except BaseException:
+                temp_path.unlink(missing_ok=True)
+                raise
+            self.janitor.track(image_path, dir_mtime_before_ns)
+            save_seconds = time.monotonic() - save_start
             
             self.logger.info(f"Image saved to: {image_path.absolute()}")
             debug_print(f"💾 Image saved: {image_path.name}")
             
             # Collect generation information
             # 收集生成信息
-            # Use the seed parameter passed from MCP server (already processed for random generation)
-            # 使用从MCP服务器传递的seed参数（已经处理过随机生成）
+            # Seed is the one actually used (random or recorded when -1 was requested)
+            # seed为实际使用的值（请求-1时为随机生成或录制时的值）
             
             generation_info = {
                 "model": getattr(response, 'model', self.model_id),
@@ -253,7 +786,15 @@ class DoubaoImageGenerator:
             result = {
                 "image_path": str(image_path.absolute()),
                 "filename": filename,
-                "generation_info": generation_info
+                "generation_info": generation_info,
+                "cassette_mode": self.cassette_mode,
+                "download_attempts": download_attempts,
+                "timings": {
+                    "api_seconds": round(api_seconds, 3),
+                    "download_seconds": round(download_seconds, 3),
+                    "save_seconds": round(save_seconds, 3),
+                    "total_seconds": round(time.monotonic() - total_start, 3)
+                }
             }
             
             self.logger.info(f"Image generation completed: {result}")
@@ -307,6 +848,116 @@ class DoubaoImageGenerator:
         except Exception as e:
             raise ValueError(f"Failed to process image data: {str(e)}")
 
+# Validation microbenchmark
+# 参数验证微基准测试
+_BASELINE_RESOLUTIONS = dict(AVAILABLE_RESOLUTIONS)
+
+def _baseline_tool(
+    prompt: Annotated[str, Field(description="Prompt for image generation, supports Chinese and English descriptions")],
+    size: Annotated[str, Field(description="Image width and height in pixels")] = "1024x1024",
+    seed: Annotated[int, Field(description="Random seed for controlling model generation randomness", ge=-1, le=2147483647)] = -1,
+    guidance_scale: Annotated[float, Field(description="Consistency between model output and prompt", ge=1.0, le=10.0)] = 8.0,
+    watermark: Annotated[bool, Field(description="Whether to add watermark to generated images")] = True,
+    file_prefix: Annotated[Optional[str], Field(description="Image filename prefix, max 20 characters")] = None
+) -> None:
+    """Former tool signature and hand-written checks, used as the benchmark baseline
+    原工具签名及手写检查，作为基准测试的比较基线"""
+    if not prompt.strip():
+        raise ValueError("Prompt cannot be empty")
+    if size not in _BASELINE_RESOLUTIONS:
+        available = ", ".join(_BASELINE_RESOLUTIONS.keys())
+        raise ValueError(f"Invalid resolution '{size}'. Available resolutions: {available}")
+    if file_prefix:
+        if not file_prefix.isascii():
+            raise ValueError("File prefix can only contain ASCII characters (letters, numbers, punctuation)")
+        if len(file_prefix) > 20:
+            raise ValueError("File prefix length cannot exceed 20 characters")
+        if not file_prefix.replace('_', '').replace('-', '').isalnum():
+            raise ValueError("File prefix can only contain letters, numbers, underscores and hyphens")
+    if not isinstance(seed, int) or seed < -1 or seed > 2147483647:
+        raise ValueError("seed must be an integer between -1 and 2147483647")
+    if not isinstance(guidance_scale, (int, float)) or guidance_scale < 1.0 or guidance_scale > 10.0:
+        raise ValueError("guidance_scale must be a number between 1.0 and 10.0")
+    if not isinstance(watermark, bool):
+        raise ValueError("watermark must be a boolean value")
+
+def _shared_fields_tool(
+    prompt: PromptField,
+    size: SizeField = "1024x1024",
+    seed: SeedField = -1,
+    guidance_scale: GuidanceScaleField = 8.0,
+    watermark: WatermarkField = True,
+    file_prefix: FilePrefixField = None
+) -> None:
+    """Current tool signature: the shared field types carry all checks
+    当前工具签名：所有检查都由共用字段类型完成"""
+
+def benchmark_request_validation(iterations: int = 20000, max_ratio: float = 1.0) -> float:
+    """Measure per-call tool argument validation against the former path, fail if it got slower
+    
+    Both paths run the way FastMCP calls a tool: the argument model generated from the
+    signature validates the arguments, then the function runs. The baseline is the former
+    signature plus its hand-written checks; the current path is the shared field types alone.
+    Using a ratio instead of an absolute time keeps the guard independent of the machine it runs on.
+    
+    按FastMCP调用工具的方式测量每次调用的参数验证开销，与原路径比较，变慢时失败
+    
+    Args:
+        iterations: Number of validations per case / 每种情况的验证次数
+        max_ratio: Maximum allowed cost relative to the former path / 相对于原路径允许的最大开销倍数
+        
+    Returns:
+        Cost ratio over all cases / 所有情况的总开销倍数
+    """
+    from mcp.server.fastmcp.utilities.func_metadata import func_metadata
+    
+    cases = {
+        "preset": {"prompt": "A cute orange cat", "size": "1024x1024", "seed": 42, "file_prefix": "cute_cat"},
+        "tuned": {"prompt": "A cute orange cat", "size": "1280x720", "guidance_scale": 7.5, "watermark": False},
+        "defaults": {"prompt": "A cute orange cat"}
+    }
+    
+    def tool_call(fn):
+        # Same steps as FuncMetadata.call_fn_with_arg_validation, without the event loop;
+        # pre_parse_json only looks at the plain types, which are identical on both paths
+        # 与FuncMetadata.call_fn_with_arg_validation相同的步骤，但不经过事件循环；
+        # pre_parse_json只依赖基础类型，两条路径完全相同
+        arg_model = func_metadata(fn).arg_model
+        def call(arguments: Dict[str, Any]) -> None:
+            fn(**arg_model.model_validate(arguments).model_dump_one_level())
+        return call
+    
+    def run(call, params: Dict[str, Any]) -> float:
+        start_time = time.perf_counter()
+        for _ in range(iterations):
+            call(params)
+        return (time.perf_counter() - start_time) / iterations * 1e6
+    
+    def best_of(params: Dict[str, Any], repeats: int = 7) -> Tuple[float, float]:
+        # Interleave both paths so that machine load affects them alike
+        # 交替运行两条路径，使机器负载对两者的影响相同
+        current_timings, baseline_timings = [], []
+        for _ in range(repeats):
+            current_timings.append(run(current_call, params))
+            baseline_timings.append(run(baseline_call, params))
+        return min(current_timings), min(baseline_timings)
+    
+    current_call = tool_call(_shared_fields_tool)
+    baseline_call = tool_call(_baseline_tool)
+    total_current_us = 0.0
+    total_baseline_us = 0.0
+    for name, params in cases.items():
+        current_us, baseline_us = best_of(params)
+        total_current_us += current_us
+        total_baseline_us += baseline_us
+        print(f"  • {name}: {current_us:.2f} µs/call (former path: {baseline_us:.2f} µs)")
+    
+    ratio = total_current_us / total_baseline_us
+    if ratio > max_ratio:
+        raise AssertionError(f"Tool argument validation is {ratio:.2f}x the former path, budget is {max_ratio:.2f}x")
+    print(f"✅ Tool argument validation within budget ({ratio:.2f}x / {max_ratio:.2f}x)")
+    return ratio
+
 # Test function
 # 测试函数
 async def test_image_generation():
@@ -360,6 +1011,11 @@ async def test_image_generation():
         traceback.print_exc()
 
 if __name__ == "__main__":
+    if "--benchmark" in sys.argv:
+        print("Doubao Image Generation Tool - Tool Argument Validation Benchmark")
+        benchmark_request_validation()
+        sys.exit(0)
+    
     print("Doubao Image Generation Tool - Standalone Test Mode")
     print("Note: Please ensure correct API key and model ID are set")
     
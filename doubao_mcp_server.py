@@ -10,17 +10,37 @@ Implements image generation functionality based on FastMCP framework and Volcano
 
 import os
 import sys
+import math
 import time
 import asyncio
 import logging
+from logging.handlers import RotatingFileHandler
 from pathlib import Path
-from typing import Dict, Any, List, Optional, Annotated
+from typing import Dict, Any, Literal, Optional, Annotated
 
 from mcp.server.fastmcp import FastMCP
-from mcp.types import TextContent
-from pydantic import Field
+from mcp.server.fastmcp.exceptions import ToolError
+from mcp.types import CallToolResult, TextContent
+from pydantic import BaseModel, Field, ValidationError
 
-from doubao_image_gen import DoubaoImageGenerator
+from doubao_image_gen import (
+    DoubaoImageGenerator,
+    PromptField,
+    SizeField,
+    SeedField,
+    GuidanceScaleField,
+    WatermarkField,
+    FilePrefixField,
+    AVAILABLE_RESOLUTIONS,
+    CUSTOM_RESOLUTION_NOTE,
+    format_validation_error,
+    ApiRequestError,
+    CassetteMissError,
+    ImageDownloadError,
+    InsufficientDiskSpaceError,
+    LOG_MAX_BYTES,
+    LOG_BACKUP_COUNT
+)
 
 # Function for outputting debug information to stderr
 # 用于将调试信息输出到stderr的函数
@@ -49,7 +69,12 @@ def setup_logging():
         level=logging.DEBUG,
         format=log_format,
         handlers=[
-            logging.FileHandler(log_dir / 'doubao_mcp_server.log', encoding='utf-8'),
+            RotatingFileHandler(
+                log_dir / 'doubao_mcp_server.log',
+                maxBytes=LOG_MAX_BYTES,
+                backupCount=LOG_BACKUP_COUNT,
+                encoding='utf-8'
+            ),
             logging.StreamHandler(sys.stderr)
         ]
     )
@@ -60,9 +85,24 @@ def setup_logging():
 # 初始化日志
 logger = setup_logging()
 
+class DoubaoMCP(FastMCP):
+    """FastMCP server that reports tool argument validation failures as structured results
+    将工具参数验证失败作为结构化结果返回的FastMCP服务器"""
+    
+    async def call_tool(self, name: str, arguments: Dict[str, Any]):
+        try:
+            return await super().call_tool(name, arguments)
+        except ToolError as e:
+            # FastMCP validates arguments against the tool's argument model ("<tool>Arguments")
+            # FastMCP根据工具的参数模型（"<tool>Arguments"）验证参数
+            cause = e.__cause__
+            if isinstance(cause, ValidationError) and cause.title == f"{name}Arguments":
+                return error_result("INVALID_PARAMETER", f"Parameter validation failed: {format_validation_error(cause)}")
+            raise
+
 # Initialize MCP server
 # 初始化MCP服务器
-mcp = FastMCP("Doubao Image Generation MCP Service")
+mcp = DoubaoMCP("Doubao Image Generation MCP Service")
 
 # Get configuration from environment variables (module-level check)
 # 从环境变量获取配置（模块级检查）
@@ -90,23 +130,39 @@ for var_name, var_value in required_env_vars.items():
 logger.info("All required environment variables loaded successfully")
 debug_print("✓ Environment variables check passed")
 
-# Define available image resolutions
-# 定义可用的图片分辨率
-AVAILABLE_RESOLUTIONS = {
-    "512x512": "512x512 (1:1 Small Square)",
-    "768x768": "768x768 (1:1 Square)",
-    "1024x1024": "1024x1024 (1:1 Large Square)",
-    "864x1152": "864x1152 (3:4 Portrait)",
-    "1152x864": "1152x864 (4:3 Landscape)",
-    "1280x720": "1280x720 (16:9 Widescreen)",
-    "720x1280": "720x1280 (9:16 Mobile Portrait)",
-    "832x1248": "832x1248 (2:3)",
-    "1248x832": "1248x832 (3:2)",
-    "1512x648": "1512x648 (21:9 Ultra-wide)",
-    "2048x2048": "2048x2048 (1:1 Extra Large Square)"
-}
+def get_number_env(var_name: str, default: float, positive: bool = False, integer: bool = False) -> float:
+    """Read an optional non-negative (or positive, or integer) numeric environment variable, exit on invalid value
+    读取可选的非负（或正、或整数）数值型环境变量，值无效时退出"""
+    raw_value = os.getenv(var_name, "").strip()
+    if not raw_value:
+        return default
+    try:
+        value = float(raw_value)
+    except ValueError:
+        value = math.nan
+    if not math.isfinite(value) or value < 0 or (positive and value == 0) or (integer and not value.is_integer()):
+        error_msg = (
+            f"Environment variable {var_name} must be a finite {'positive' if positive else 'non-negative'} "
+            f"{'integer' if integer else 'number'}"
+        )
+        logger.error(error_msg)
+        debug_print(f"Error: {error_msg}")
+        sys.exit(1)
+    return value
 
+# Optional record/replay configuration for offline testing and benchmarking
+# 可选的录制/回放配置，用于离线测试和基准测试
+CASSETTE_MODE = os.getenv("CASSETTE_MODE", "off").strip().lower() or "off"
+CASSETTE_DIR = os.getenv("CASSETTE_DIR", "").strip() or None
+CASSETTE_LATENCY_SCALE = get_number_env("CASSETTE_LATENCY_SCALE", 1.0)
 
+# Optional output retention and disk space configuration (0 disables a limit)
+# 可选的输出保留和磁盘空间配置（0表示不启用该限制）
+RETENTION_MAX_AGE_DAYS = get_number_env("RETENTION_MAX_AGE_DAYS", 0)
+RETENTION_MAX_TOTAL_MB = get_number_env("RETENTION_MAX_TOTAL_MB", 0)
+RETENTION_MAX_FILES = int(get_number_env("RETENTION_MAX_FILES", 0, integer=True))
+MIN_FREE_SPACE_MB = get_number_env("MIN_FREE_SPACE_MB", 100)
+JANITOR_INTERVAL_SECONDS = get_number_env("JANITOR_INTERVAL_SECONDS", 300, positive=True)
 
 # Initialize image generation tool
 # 初始化图像生成工具
@@ -114,7 +170,15 @@ image_generator = DoubaoImageGenerator(
     base_url=BASE_URL,
     api_key=DOUBAO_API_KEY,
     model_id=API_MODEL_ID,
-    save_dir=IMAGE_SAVE_DIR
+    save_dir=IMAGE_SAVE_DIR,
+    cassette_mode=CASSETTE_MODE,
+    cassette_dir=CASSETTE_DIR,
+    latency_scale=CASSETTE_LATENCY_SCALE,
+    retention_max_age=RETENTION_MAX_AGE_DAYS * 86400,
+    retention_max_bytes=int(RETENTION_MAX_TOTAL_MB * 1024 * 1024),
+    retention_max_files=RETENTION_MAX_FILES,
+    min_free_bytes=int(MIN_FREE_SPACE_MB * 1024 * 1024),
+    janitor_interval=JANITOR_INTERVAL_SECONDS
 )
 
 @mcp.resource("doubao://resolutions")
@@ -136,43 +200,113 @@ def format_options(options_dict: Dict[str, str]) -> str:
 # 格式化分辨率选项
 available_resolutions_list = format_options(AVAILABLE_RESOLUTIONS)
 
-def validate_ascii_only(text: str, field_name: str) -> None:
-    """Validate if text contains only ASCII characters
-    验证文本是否只包含ASCII字符"""
-    if not text.isascii():
-        raise ValueError(f"{field_name} can only contain ASCII characters (letters, numbers, punctuation)")
+# Structured tool result returned as MCP structured content next to the human-readable text
+# 与可读文本一起作为MCP结构化内容返回的工具结果
+ErrorCode = Literal[
+    "INVALID_PARAMETER",
+    "INSUFFICIENT_DISK_SPACE",
+    "API_ERROR",
+    "DOWNLOAD_FAILED",
+    "CASSETTE_MISS",
+    "UNEXPECTED_RESULT",
+    "INTERNAL_ERROR"
+]
+
+class GenerationError(BaseModel):
+    """Machine-readable error information
+    机器可读的错误信息"""
+    code: ErrorCode
+    message: str
+
+class GenerationTimings(BaseModel):
+    """Timings of each generation stage in seconds
+    各生成阶段耗时（秒）"""
+    api_seconds: float
+    download_seconds: float
+    save_seconds: float
+    total_seconds: float
 
-def validate_resolution(size: str) -> None:
-    """Validate if resolution is valid
-    验证分辨率是否有效"""
-    if size not in AVAILABLE_RESOLUTIONS:
-        available = ", ".join(AVAILABLE_RESOLUTIONS.keys())
-        raise ValueError(f"Invalid resolution '{size}'. Available resolutions: {available}")
+class ImageGenerationResult(BaseModel):
+    """Result of doubao_generate_image
+    doubao_generate_image的返回结果"""
+    success: bool
+    image_path: Optional[str] = None
+    filename: Optional[str] = None
+    size: Optional[str] = None
+    seed: Optional[int] = None
+    guidance_scale: Optional[float] = None
+    watermark: Optional[bool] = None
+    model: Optional[str] = None
+    original_url: Optional[str] = None
+    cassette_mode: Optional[str] = Field(default=None, description="Record/replay mode used: off, record or replay")
+    download_attempts: Optional[int] = None
+    timings: Optional[GenerationTimings] = None
+    error: Optional[GenerationError] = None
 
+def tool_result(result: ImageGenerationResult, text: str) -> CallToolResult:
+    """Wrap a typed result and its human-readable text into a tool result
+    将类型化结果及其可读文本封装为工具结果"""
+    return CallToolResult(
+        content=[TextContent(type="text", text=text)],
+        structuredContent=result.model_dump(mode="json"),
+        isError=not result.success
+    )
+
+def error_result(code: ErrorCode, message: str, exc_info: bool = False) -> CallToolResult:
+    """Log an error and build a failed tool result
+    记录错误并构造失败的工具结果"""
+    logger.error(f"{code}: {message}", exc_info=exc_info)
+    debug_print(f"❌ {message}")
+    result = ImageGenerationResult(success=False, error=GenerationError(code=code, message=message))
+    return tool_result(result, f"❌ {message}")
+
+def format_result_text(result: Dict[str, Any], prompt: str) -> str:
+    """Format the human-readable summary of a successful generation
+    格式化生成成功时的可读摘要"""
+    generation_info = result.get("generation_info", {})
+    lines = [
+        "🎨 Image generation successful!",
+        "",
+        f"📁 Save path: {result['image_path']}",
+        f"📐 Resolution: {generation_info.get('size')}",
+        f"🎯 Prompt: {prompt}",
+        f"🎲 Seed: {generation_info.get('seed')}"
+    ]
+    if generation_info:
+        lines.append("")
+        lines.append("📊 Generation info:")
+        lines.extend(f"  • {key}: {value}" for key, value in generation_info.items())
+    return "\n".join(lines) + "\n"
+
+# Parameters use the shared request field types; FastMCP validates (and normalizes) them once
+# per call, and DoubaoMCP turns validation failures into INVALID_PARAMETER results
+# 参数使用共用的请求字段类型；FastMCP对每次调用验证（并规范化）一次，
+# DoubaoMCP将验证失败转换为INVALID_PARAMETER结果
 @mcp.tool()
 async def doubao_generate_image(
-    prompt: Annotated[str, Field(description="Prompt for image generation, supports Chinese and English descriptions")],
-    size: Annotated[str, Field(description=f"Image width and height in pixels, available values:\n{available_resolutions_list}")] = "1024x1024",
-    seed: Annotated[int, Field(description="Random seed for controlling model generation randomness, if not specified, a random number will be auto-generated", ge=-1, le=2147483647)] = -1,
-    guidance_scale: Annotated[float, Field(description="Consistency between model output and prompt, higher values follow prompt more strictly", ge=1.0, le=10.0)] = 8.0,
-    watermark: Annotated[bool, Field(description="Whether to add watermark to generated images")] = True,
-    file_prefix: Annotated[Optional[str], Field(description="Image filename prefix (letters, numbers, underscores only), max 20 characters")] = None
-) -> List[TextContent]:
+    prompt: PromptField,
+    size: SizeField = "1024x1024",
+    seed: SeedField = -1,
+    guidance_scale: GuidanceScaleField = 8.0,
+    watermark: WatermarkField = True,
+    file_prefix: FilePrefixField = None
+) -> Annotated[CallToolResult, ImageGenerationResult]:
     """Generate image using Doubao API
     
     This function is the core tool function of the MCP server, used to call Doubao (Volcano Engine) API to generate images.
-    The function validates input parameters, calls the underlying image generator, and returns formatted result information.
+    The function receives parameters already validated against the shared field types, calls the underlying image generator, and returns a structured result
+    (MCP structured content) together with a human-readable summary.
     
     使用豆包API生成图像
     
     这个函数是MCP服务器的核心工具函数，用于调用豆包（火山方舟）API生成图像。
-    函数会验证输入参数，调用底层的图像生成器，并返回格式化的结果信息。
+    函数接收已按共用字段类型验证的参数，调用底层的图像生成器，并返回结构化结果（MCP结构化内容）及可读摘要。
     
     Args:
         prompt (str): Prompt for image generation, supports Chinese and English descriptions, cannot be empty
                      用于生成图像的提示词，支持中英文描述，不能为空
-        size (str): Image width and height in pixels, must be one of predefined resolutions, default "1024x1024"
-                   生成图像的宽高像素，必须是预定义的分辨率之一，默认"1024x1024"
+        size (str): Image width and height in pixels, a predefined resolution or custom WxH within model limits, default "1024x1024"
+                   生成图像的宽高像素，预定义分辨率或在模型限制内的自定义WxH，默认"1024x1024"
         seed (int): Random seed for controlling model generation randomness, if not specified, a random number will be auto-generated, range -1 to 2147483647
                    随机数种子，用于控制模型生成内容的随机性，如果不指定则自动生成随机数，范围-1到2147483647
         guidance_scale (float): Consistency between model output and prompt, higher values follow prompt more strictly, range 1.0 to 10.0
@@ -183,115 +317,65 @@ async def doubao_generate_image(
                                     图片文件名前缀，仅限英文字母、数字、下划线和连字符，长度不超过20个字符
     
     Returns:
-        List[TextContent]: Text content list containing image generation result information, including save path, resolution, prompt, etc.
-                          包含图像生成结果信息的文本内容列表，包括保存路径、分辨率、提示词等信息
-    
-    Raises:
-        ValueError: Raised when input parameters do not meet requirements, such as empty prompt, invalid resolution, incorrect file prefix format, etc.
-                   当输入参数不符合要求时抛出，如提示词为空、分辨率无效、文件前缀格式错误等
+        CallToolResult: Human-readable summary as text content, and an ImageGenerationResult as structured content
+                        with save path, seed, size, timings and record/replay and retry status;
+                        on failure, isError is set and error holds a machine-readable code
+                        文本内容为可读摘要，结构化内容为ImageGenerationResult，包含保存路径、种子、分辨率、
+                        耗时以及录制回放和重试状态；失败时isError为真，error中包含机器可读的错误码
     """
     
     logger.info(f"Starting image generation, prompt: {prompt[:50]}...")
     debug_print(f"🎨 Starting image generation: {prompt[:50]}...")
+    logger.info(f"Parameter validation passed, calling image generation API")
     
     try:
-        # Parameter validation
-        # 参数验证
-        if not prompt.strip():
-            raise ValueError("Prompt cannot be empty")
-        
-        # Validate resolution
-        # 验证分辨率
-        validate_resolution(size)
-        
-        # Validate file prefix (if provided)
-        # 验证文件前缀（如果提供）
-        if file_prefix:
-            validate_ascii_only(file_prefix, "File prefix")
-            # Validate file prefix length
-            # 验证文件前缀长度
-            if len(file_prefix) > 20:
-                raise ValueError("File prefix length cannot exceed 20 characters")
-            # Validate file prefix format
-            # 验证文件前缀格式
-            if not file_prefix.replace('_', '').replace('-', '').isalnum():
-                raise ValueError("File prefix can only contain letters, numbers, underscores and hyphens")
-        
-        # Validate other parameters
-        # 验证其他参数
-        if not isinstance(seed, int) or seed < -1 or seed > 2147483647:
-            raise ValueError("seed must be an integer between -1 and 2147483647")
-        
-        if not isinstance(guidance_scale, (int, float)) or guidance_scale < 1.0 or guidance_scale > 10.0:
-            raise ValueError("guidance_scale must be a number between 1.0 and 10.0")
-        
-        if not isinstance(watermark, bool):
-            raise ValueError("watermark must be a boolean value")
-        
-        logger.info(f"Parameter validation passed, calling image generation API")
-        
-        # Process seed parameter: if -1, generate a random number
-        # 处理seed参数：如果是-1，则生成随机数
-        import random
-        actual_seed = seed
-        if seed == -1:
-            actual_seed = random.randint(0, 2147483647)
-            logger.info(f"Generated random seed: {actual_seed}")
-        
         # Call image generation processing
         # 调用图像生成处理
         result = await asyncio.create_task(
             image_generator.generate_image(
                 prompt=prompt,
                 size=size,
-                seed=actual_seed,
+                seed=seed,
                 guidance_scale=guidance_scale,
                 watermark=watermark,
                 file_prefix=file_prefix
             )
         )
-        
-        logger.info(f"Image generation successful, result: {result}")
-        debug_print(f"✅ Image generation successful")
-        
-        # Process return result
-        # 处理返回结果
-        if isinstance(result, dict) and "image_path" in result:
-            image_path = result["image_path"]
-            generation_info = result.get("generation_info", {})
-            
-            response_text = f"🎨 Image generation successful!\n\n"
-            response_text += f"📁 Save path: {image_path}\n"
-            response_text += f"📐 Resolution: {size}\n"
-            response_text += f"🎯 Prompt: {prompt}\n"
-            
-            # Display actual seed used (from generation_info if available)
-            # 显示实际使用的seed值（如果generation_info中有的话）
-            actual_seed = generation_info.get('seed', seed) if generation_info else seed
-            response_text += f"🎲 Seed: {actual_seed}\n"
-            
-            if generation_info:
-                response_text += f"\n📊 Generation info:\n"
-                for key, value in generation_info.items():
-                    response_text += f"  • {key}: {value}\n"
-            
-            return [TextContent(type="text", text=response_text)]
-        else:
-            error_msg = "Image generation returned unexpected result format"
-            logger.error(f"{error_msg}: {result}")
-            return [TextContent(type="text", text=f"❌ {error_msg}")]
-            
-    except ValueError as e:
-        error_msg = f"Parameter validation failed: {str(e)}"
-        logger.error(error_msg)
-        debug_print(f"❌ {error_msg}")
-        return [TextContent(type="text", text=f"❌ {error_msg}")]
-        
+    except InsufficientDiskSpaceError as e:
+        return error_result("INSUFFICIENT_DISK_SPACE", str(e))
+    except CassetteMissError as e:
+        return error_result("CASSETTE_MISS", str(e))
+    except ImageDownloadError as e:
+        return error_result("DOWNLOAD_FAILED", str(e))
+    except ApiRequestError as e:
+        return error_result("API_ERROR", str(e))
     except Exception as e:
-        error_msg = f"Error occurred during image generation: {str(e)}"
-        logger.error(error_msg, exc_info=True)
-        debug_print(f"❌ {error_msg}")
-        return [TextContent(type="text", text=f"❌ {error_msg}")]
+        return error_result("INTERNAL_ERROR", f"Error occurred during image generation: {str(e)}", exc_info=True)
+    
+    logger.info(f"Image generation successful, result: {result}")
+    debug_print(f"✅ Image generation successful")
+    
+    # Process return result
+    # 处理返回结果
+    if not isinstance(result, dict) or "image_path" not in result:
+        return error_result("UNEXPECTED_RESULT", f"Image generation returned unexpected result format: {result}")
+    
+    generation_info = result.get("generation_info", {})
+    typed_result = ImageGenerationResult(
+        success=True,
+        image_path=result["image_path"],
+        filename=result.get("filename"),
+        size=generation_info.get("size", size),
+        seed=generation_info.get("seed"),
+        guidance_scale=generation_info.get("guidance_scale", guidance_scale),
+        watermark=generation_info.get("watermark", watermark),
+        model=generation_info.get("model"),
+        original_url=generation_info.get("original_url"),
+        cassette_mode=result.get("cassette_mode"),
+        download_attempts=result.get("download_attempts"),
+        timings=result.get("timings")
+    )
+    return tool_result(typed_result, format_result_text(result, prompt))
 
 @mcp.prompt()
 def image_generation_prompt(
@@ -318,14 +402,15 @@ def image_generation_prompt(
 
 ## Available Resolution Options
 {available_resolutions_list}
+{CUSTOM_RESOLUTION_NOTE}
 
 ## Parameter Description
 - **prompt**: Image description text, supports Chinese and English, more detailed descriptions yield better results
-- **size**: Image width and height in pixels, choose from available options above
+- **size**: Image width and height in pixels, choose from available options above or use a custom WxH size
 - **seed**: Random seed, if not specified, a random number will be auto-generated, same seed can reproduce results
 - **guidance_scale**: 1.0-10.0, higher values follow prompt more strictly
 - **watermark**: Whether to add "AI Generated" watermark
-- **file_prefix**: Image filename prefix, letters, numbers and underscores only
+- **file_prefix**: Image filename prefix, letters, numbers, underscores and hyphens only
 
 ## Usage Example
 ```
@@ -354,6 +439,10 @@ def main():
     debug_print(f"  • API_MODEL_ID: {API_MODEL_ID}")
     debug_print(f"  • IMAGE_SAVE_DIR: {IMAGE_SAVE_DIR}")
     debug_print(f"  • DOUBAO_API_KEY: {'Set' if DOUBAO_API_KEY else 'Not Set'}")
+    if CASSETTE_MODE != "off":
+        debug_print(f"  • CASSETTE_MODE: {CASSETTE_MODE} ({CASSETTE_DIR}, latency x{CASSETTE_LATENCY_SCALE})")
+    debug_print(f"  • RETENTION: max age {RETENTION_MAX_AGE_DAYS} days, max size {RETENTION_MAX_TOTAL_MB} MB, max files {RETENTION_MAX_FILES}")
+    debug_print(f"  • MIN_FREE_SPACE_MB: {MIN_FREE_SPACE_MB}")
     
     # Start MCP server
     # 启动MCP服务器